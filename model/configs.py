@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import argparse
+import os
 import torch
 from pathlib import Path
 import pprint
@@ -25,10 +26,13 @@ class Config(object):
     def __init__(self, **kwargs):
         """Configuration Class: set kwargs as class attributes with setattr"""
         self.log_dir, self.score_dir, self.save_dir = None, None, None
-        self.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
         for k, v in kwargs.items():
             setattr(self, k, v)
 
+        # Each process of a distributed (torchrun) training uses its own GPU
+        self.distributed = int(os.environ.get('WORLD_SIZE', 1)) > 1
+        self.device = torch.device(f"cuda:{self.local_rank}" if torch.cuda.is_available() else "cpu")
+
         self.set_dataset_dir(self.video_type)
 
     def set_dataset_dir(self, video_type='TVSum'):
@@ -77,6 +81,12 @@ def get_config(parse=True, **optional_kwargs):
     parser.add_argument('--split_index', type=int, default=0, help='Data split to be used [0-4]')
     parser.add_argument('--init_type', type=str, default="xavier", help='Weight initialization method')
     parser.add_argument('--init_gain', type=float, default=None, help='Scaling factor for the initialization methods')
+    parser.add_argument('--amp', type=str2bool, default='false', help='Use mixed precision training on GPU')
+    parser.add_argument('--compile', type=str2bool, default='false', help='Compile the model with torch.compile')
+    parser.add_argument('--pad_multiple', type=int, default=64,
+                        help='Pad the training batches to a multiple of it when compiling')
+    parser.add_argument('--local_rank', '--local-rank', type=int, default=int(os.environ.get('LOCAL_RANK', 0)),
+                        help='GPU of the current process in distributed training')
 
     if parse:
         kwargs = parser.parse_args()
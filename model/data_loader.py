@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 import torch
+import torch.nn.functional as F
+from torch.nn.utils.rnn import pad_sequence
 from torch.utils.data import Dataset, DataLoader
+from torch.utils.data.distributed import DistributedSampler
 import h5py
 import numpy as np
 import json
+import os
+from functools import partial
 
 
 class VideoData(Dataset):
@@ -67,20 +72,51 @@ class VideoData(Dataset):
         return frame_features, gtscore, video_name
         
 
-def get_loader(mode, video_type, split_index):
+def collate_videos(batch, pad_multiple=1):
+    """ Collate a list of videos of different lengths into a padded batch.
+
+    :param list[tuple] batch: The (frame_features, gtscore, video_name) samples of `VideoData`.
+    :param int pad_multiple: Round the padded length T up to a multiple of it, bounding the number of distinct shapes.
+    :return: A tuple of:
+        frame_features: Tensor with shape [B, T, input_size], zero-padded up to the longest video T.
+        gtscores: Tensor with shape [B, T], zero-padded up to the longest video T.
+        lengths: Tensor with shape [B] containing the number of frames of each video.
+    """
+    frame_features, gtscores, _ = zip(*batch)
+    lengths = torch.tensor([len(features) for features in frame_features])
+    frame_features, gtscores = pad_sequence(frame_features, batch_first=True), pad_sequence(gtscores, batch_first=True)
+
+    extra = -frame_features.shape[1] % pad_multiple
+    if extra:
+        frame_features, gtscores = F.pad(frame_features, (0, 0, 0, extra)), F.pad(gtscores, (0, extra))
+    return frame_features, gtscores, lengths
+
+
+def get_loader(mode, video_type, split_index, batch_size=1, inference=False, distributed=False, pad_multiple=1):
     """ Loads the `data.Dataset` of the `split_index` split for the `video_type` Dataset.
-    Wrapped by a Dataloader, shuffled and `batch_size` = 1 in train `mode`.
+    Wrapped by a Dataloader, shuffled and padded into batches of `batch_size` videos in train `mode`; unbatched and in
+    order in test `mode` or when used for `inference`. The loaded tensors are placed in pinned memory, allowing
+    asynchronous copies to the GPU.
 
     :param str mode: The mode of the model, train or test.
     :param str video_type: The Dataset being used, SumMe or TVSum.
     :param int split_index: The index of the Dataset split being used.
-    :return: The Dataset used in each mode.
+    :param int batch_size: The number of videos in each training batch; the last incomplete batch is dropped.
+    :param bool inference: Load the videos of the `mode` keys one by one, e.g. for evaluating on the train videos.
+    :param bool distributed: In train `mode`, load only the shard of the videos that belongs to the current process.
+    :param int pad_multiple: In train `mode`, pad the batches to a length that is a multiple of it.
+    :return: The Dataloader used in each mode.
     """
-    if mode.lower() == 'train':
-        vd = VideoData(mode, video_type, split_index)
-        return DataLoader(vd, batch_size=1, shuffle=True)
+    vd = VideoData(mode, video_type, split_index)
+    num_workers = max(2, (os.cpu_count() or 1) // 2)
+    if mode.lower() == 'train' and not inference:
+        sampler = DistributedSampler(vd) if distributed else None
+        return DataLoader(vd, batch_size=batch_size, shuffle=sampler is None, sampler=sampler, drop_last=True,
+                          collate_fn=partial(collate_videos, pad_multiple=pad_multiple),
+                          pin_memory=torch.cuda.is_available(), num_workers=num_workers, persistent_workers=True)
     else:
-        return VideoData(mode, video_type, split_index)
+        return DataLoader(vd, batch_size=None, pin_memory=torch.cuda.is_available(),
+                          num_workers=num_workers, persistent_workers=True)
 
 
 if __name__ == '__main__':
@@ -2,6 +2,7 @@
 import torch
 import torch.nn as nn
 import numpy as np
+from typing import List, Optional
 
 
 class SelfAttention(nn.Module):
@@ -36,7 +37,7 @@ class SelfAttention(nn.Module):
         self.softmax = nn.Softmax(dim=-1)
         self.drop = nn.Dropout(p=0.5)
 
-    def getAbsolutePosition(self, T):
+    def getAbsolutePosition(self, T: int):
         """Calculate the sinusoidal positional encoding based on the absolute position of each considered frame.
         Based on 'Attention is all you need' paper (https://arxiv.org/abs/1706.03762)
 
@@ -46,8 +47,8 @@ class SelfAttention(nn.Module):
         freq = self.freq
         d = self.input_size
 
-        pos = torch.tensor([k for k in range(T)], device=self.out.weight.device)
-        i = torch.tensor([k for k in range(T//2)], device=self.out.weight.device)
+        pos = torch.arange(T, device=self.out.weight.device)
+        i = torch.arange(T//2, device=self.out.weight.device)
 
         # Reshape tensors each pos_k for each i indices
         pos = pos.reshape(pos.shape[0], 1)
@@ -59,7 +60,7 @@ class SelfAttention(nn.Module):
         AP[pos, 2*i+1] = torch.cos(pos / freq ** ((2 * i) / d))
         return AP
 
-    def getRelativePosition(self, T):
+    def getRelativePosition(self, T: int):
         """Calculate the sinusoidal positional encoding based on the relative position of each considered frame.
         r_pos calculations as here: https://theaisummer.com/positional-embeddings/
 
@@ -70,8 +71,8 @@ class SelfAttention(nn.Module):
         d = 2 * T
         min_rpos = -(T - 1)
 
-        i = torch.tensor([k for k in range(T)], device=self.out.weight.device)
-        j = torch.tensor([k for k in range(T)], device=self.out.weight.device)
+        i = torch.arange(T, device=self.out.weight.device)
+        j = torch.arange(T, device=self.out.weight.device)
 
         # Reshape tensors each i for each j indices
         i = i.reshape(i.shape[0], 1)
@@ -82,35 +83,55 @@ class SelfAttention(nn.Module):
         r_pos = j - i - min_rpos
 
         RP = torch.zeros(T, T, device=self.out.weight.device)
-        idx = torch.tensor([k for k in range(T//2)], device=self.out.weight.device)
+        idx = torch.arange(T//2, device=self.out.weight.device)
         RP[:, 2*idx] = torch.sin(r_pos[:, 2*idx] / freq ** ((i[:, 2*idx] + j[:, 2*idx]) / d))
         RP[:, 2*idx+1] = torch.cos(r_pos[:, 2*idx+1] / freq ** ((i[:, 2*idx+1] + j[:, 2*idx+1]) / d))
         return RP
 
-    def forward(self, x):
+    def getPosition(self, T: int):
+        """Calculate the selected (absolute or relative) sinusoidal positional encoding.
+
+        :param int T: Number of frames contained in Q, K and V
+        :return: Tensor with shape [T, T]
+        """
+        if self.pos_enc == "absolute":
+            return self.getAbsolutePosition(T=T)
+        return self.getRelativePosition(T=T)
+
+    def forward(self, x, mask: Optional[torch.Tensor] = None, lengths: Optional[List[int]] = None):
         """ Compute the weighted frame features, based on either the global or local (multi-head) attention mechanism.
 
-        :param torch.tensor x: Frame features with shape [T, input_size]
+        :param torch.tensor x: Frame features with shape [T, input_size], or [B, T, input_size] for a padded batch
+        :param None | torch.Tensor mask: Boolean tensor with shape [B, T] marking the valid -not padded- frames of x
+        :param None | list[int] lengths: The number of valid frames of each video of the padded batch, given with mask
         :return: A tuple of:
-                    y: Weighted features based on the attention weights, with shape [T, input_size]
-                    att_weights : The attention weights (before dropout), with shape [T, T]
+                    y: Weighted features based on the attention weights, with shape [T, input_size] ([B, T, input_size])
+                    att_weights : The attention weights (before dropout), with shape [T, T] ([B, T, T])
         """
+        # The positional encoding is the same for all heads; for a padded batch it is based on each video's length
+        position: Optional[torch.Tensor] = None
+        if self.pos_enc is not None:
+            if lengths is None:
+                position = self.getPosition(T=x.shape[0])
+            else:
+                position = torch.zeros(x.shape[0], x.shape[1], x.shape[1], device=x.device)
+                for b, length in enumerate(lengths):
+                    position[b, :length, :length] = self.getPosition(T=length)
+
         outputs = []
-        for head in range(self.heads):
-            K = self.Wk[head](x)
-            Q = self.Wq[head](x)
-            V = self.Wv[head](x)
+        for Wk, Wq, Wv in zip(self.Wk, self.Wq, self.Wv):
+            K = Wk(x)
+            Q = Wq(x)
+            V = Wv(x)
 
             # Q *= 0.06                       # scale factor VASNet
             # Q /= np.sqrt(self.output_size)  # scale factor (i.e 1 / sqrt(d_k) )
-            energies = torch.matmul(Q, K.transpose(1, 0))
-            if self.pos_enc is not None:
-                if self.pos_enc == "absolute":
-                    AP = self.getAbsolutePosition(T=energies.shape[0])
-                    energies = energies + AP
-                elif self.pos_enc == "relative":
-                    RP = self.getRelativePosition(T=energies.shape[0])
-                    energies = energies + RP
+            energies = torch.matmul(Q, K.transpose(-1, -2))
+            if position is not None:
+                energies = energies + position
+            if mask is not None:
+                # Padded frames must not be attended to
+                energies = energies.masked_fill(~mask.unsqueeze(1), float('-inf'))
 
             att_weights = self.softmax(energies)
             _att_weights = self.drop(att_weights)
@@ -118,7 +139,7 @@ class SelfAttention(nn.Module):
 
             # Save the current head output
             outputs.append(y)
-        y = self.out(torch.cat(outputs, dim=1))
+        y = self.out(torch.cat(outputs, dim=-1))
         return y, att_weights.clone()  # for now we don't deal with the weights (probably max or avg pooling)
 
 
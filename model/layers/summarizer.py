@@ -3,6 +3,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import math
+from typing import List, Optional, Tuple
 from layers.attention import SelfAttention
 
 
@@ -39,37 +40,49 @@ class MultiAttention(nn.Module):
             self.fusion = self.fusion.lower()
             assert self.fusion in self.permitted_fusions, f"Fusion method must be: {*self.permitted_fusions,}"
 
-    def forward(self, x):
+    def forward(self, x, mask: Optional[torch.Tensor] = None, lengths: Optional[List[int]] = None):
         """ Compute the weighted frame features, based on the global and locals (multi-head) attention mechanisms.
 
-        :param torch.Tensor x: Tensor with shape [T, input_size] containing the frame features.
+        :param torch.Tensor x: Tensor with shape [T, input_size], or [B, T, input_size] for a padded batch, containing
+        the frame features.
+        :param None | torch.Tensor mask: Boolean tensor with shape [B, T] marking the valid -not padded- frames of x.
+        :param None | list[int] lengths: The number of valid frames of each video of the padded batch, given with mask.
         :return: A tuple of:
-            weighted_value: Tensor with shape [T, input_size] containing the weighted frame features.
-            attn_weights: Tensor with shape [T, T] containing the attention weights.
+            weighted_value: Tensor with shape [T, input_size] ([B, T, input_size]) with the weighted frame features.
+            attn_weights: Tensor with shape [T, T] ([B, T, T]) containing the attention weights.
         """
-        weighted_value, attn_weights = self.attention(x)  # global attention
+        weighted_value, attn_weights = self.attention(x, mask, lengths)  # global attention
 
         if self.num_segments is not None and self.fusion is not None:
-            segment_size = math.ceil(x.shape[0] / self.num_segments)
-            for segment in range(self.num_segments):
-                left_pos = segment * segment_size
-                right_pos = (segment + 1) * segment_size
-                local_x = x[left_pos:right_pos]
-                weighted_local_value, attn_local_weights = self.local_attention[segment](local_x)  # local attentions
-
-                # Normalize the features vectors
-                weighted_value[left_pos:right_pos] = F.normalize(weighted_value[left_pos:right_pos].clone(), p=2, dim=1)
-                weighted_local_value = F.normalize(weighted_local_value, p=2, dim=1)
-                if self.fusion == "add":
-                    weighted_value[left_pos:right_pos] += weighted_local_value
-                elif self.fusion == "mult":
-                    weighted_value[left_pos:right_pos] *= weighted_local_value
-                elif self.fusion == "avg":
-                    weighted_value[left_pos:right_pos] += weighted_local_value
-                    weighted_value[left_pos:right_pos] /= 2
-                elif self.fusion == "max":
-                    weighted_value[left_pos:right_pos] = torch.max(weighted_value[left_pos:right_pos].clone(),
-                                                                   weighted_local_value)
+            # The segments of each video are defined by its own length, not the padded one
+            videos: List[Tuple[torch.Tensor, torch.Tensor]] = []
+            if lengths is None:
+                videos.append((x, weighted_value))
+            else:
+                for b, length in enumerate(lengths):
+                    videos.append((x[b, :length], weighted_value[b, :length]))
+
+            for video_x, video_value in videos:
+                segment_size = math.ceil(video_x.shape[0] / self.num_segments)
+                for segment, local_attention in enumerate(self.local_attention):
+                    left_pos = segment * segment_size
+                    right_pos = (segment + 1) * segment_size
+                    local_x = video_x[left_pos:right_pos]
+                    weighted_local_value, attn_local_weights = local_attention(local_x)  # local attentions
+
+                    # Normalize the features vectors
+                    video_value[left_pos:right_pos] = F.normalize(video_value[left_pos:right_pos].clone(), p=2.0, dim=1)
+                    weighted_local_value = F.normalize(weighted_local_value, p=2.0, dim=1)
+                    if self.fusion == "add":
+                        video_value[left_pos:right_pos] += weighted_local_value
+                    elif self.fusion == "mult":
+                        video_value[left_pos:right_pos] *= weighted_local_value
+                    elif self.fusion == "avg":
+                        video_value[left_pos:right_pos] += weighted_local_value
+                        video_value[left_pos:right_pos] /= 2
+                    elif self.fusion == "max":
+                        video_value[left_pos:right_pos] = torch.max(video_value[left_pos:right_pos].clone(),
+                                                                    weighted_local_value)
 
         return weighted_value, attn_weights
 
@@ -100,17 +113,24 @@ class PGL_SUM(nn.Module):
         self.relu = nn.ReLU()
         self.sigmoid = nn.Sigmoid()
 
-    def forward(self, frame_features):
+    def forward(self, frame_features, lengths: Optional[List[int]] = None):
         """ Produce frames importance scores from the frame features, using the PGL-SUM model.
 
         :param torch.Tensor frame_features: Tensor of shape [T, input_size] containing the frame features produced by
-        using the pool5 layer of GoogleNet.
+        using the pool5 layer of GoogleNet, or [B, T, input_size] for a batch of videos padded to the same length.
+        :param None | list[int] lengths: The number of valid -not padded- frames of each video of the batch; given on
+        the host, so that the padding is known without reading it back from the device.
         :return: A tuple of:
-            y: Tensor with shape [1, T] containing the frames importance scores in [0, 1].
-            attn_weights: Tensor with shape [T, T] containing the attention weights.
+            y: Tensor with shape [1, T] ([B, T]) containing the frames importance scores in [0, 1]; zero when padded.
+            attn_weights: Tensor with shape [T, T] ([B, T, T]) containing the attention weights.
         """
+        mask: Optional[torch.Tensor] = None
+        if lengths is not None:
+            positions = torch.arange(frame_features.shape[1], device=frame_features.device)
+            mask = positions[None, :] < torch.tensor(lengths, device=frame_features.device)[:, None]
+
         residual = frame_features
-        weighted_value, attn_weights = self.attention(frame_features)
+        weighted_value, attn_weights = self.attention(frame_features, mask, lengths)
         y = weighted_value + residual
         y = self.drop(y)
         y = self.norm_y(y)
@@ -123,7 +143,10 @@ class PGL_SUM(nn.Module):
 
         y = self.linear_2(y)
         y = self.sigmoid(y)
-        y = y.view(1, -1)
+        if mask is None:
+            y = y.view(1, -1)
+        else:
+            y = y.view(mask.shape) * mask
 
         return y, attn_weights
 
@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
+import torch
 from configs import get_config
 from solver import Solver
 from data_loader import get_loader
-from data_loader import VideoData    
 
 
 if __name__ == '__main__':
@@ -13,12 +13,23 @@ if __name__ == '__main__':
     print(config)
     print(test_config)
     print('Currently selected split_index:', config.split_index)
-    train_loader = get_loader(config.mode, config.video_type, config.split_index)
+    if config.distributed:
+        if torch.cuda.is_available():
+            torch.distributed.init_process_group(backend='nccl')
+            torch.cuda.set_device(config.device)
+        else:
+            torch.distributed.init_process_group(backend='gloo')
+    # The padding only bounds the number of shapes seen by the compiled model; eager training pads to the longest video
+    train_loader = get_loader(config.mode, config.video_type, config.split_index, config.batch_size,
+                              distributed=config.distributed, pad_multiple=config.pad_multiple if config.compile else 1)
     test_loader = get_loader(test_config.mode, test_config.video_type, test_config.split_index)
-    train_infer_loader = VideoData('train', 'summe', test_config.split_index)
+    train_infer_loader = get_loader('train', 'summe', test_config.split_index, inference=True)
     solver = Solver(config, train_loader, test_loader, train_infer_loader)
 
     solver.build()
-    solver.evaluate(-1)	 # evaluates the summaries using the initial random weights of the network
+    if solver.is_main:
+        solver.evaluate(-1)	 # evaluates the summaries using the initial random weights of the network
     solver.train()
+    if config.distributed:
+        torch.distributed.destroy_process_group()
 # tensorboard --logdir '../PGL-SUM/Summaries/PGL-SUM/'
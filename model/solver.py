@@ -7,11 +7,117 @@ import os
 import random
 import json
 import h5py
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from torch.nn.parallel import DistributedDataParallel as DDP
 from tqdm.notebook import tqdm, trange
 from layers.summarizer import PGL_SUM
 from utils import TensorboardWriter
 from generate_summary import generate_summary
 
+try:
+    import numba
+except ImportError:  # numba is optional, fall back to the vectorized NumPy implementation
+    numba = None
+
+
+# Number of set bits for each possible byte value, used when np.bitwise_count is not available (NumPy < 2.0)
+_POPCOUNT_LUT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+
+def _popcount(packed, axis=None):
+    """ Count the set bits of a bit-packed uint8 array.
+
+    :param ndarray packed: The bit-packed array, as produced by np.packbits.
+    :param None | int axis: The axis along which the bits are counted; None counts over the whole array.
+    :return: The number of set bits.
+    """
+    if hasattr(np, 'bitwise_count'):
+        counts = np.bitwise_count(packed)
+    else:
+        counts = _POPCOUNT_LUT[packed]
+    return counts.sum(axis=axis, dtype=np.int64)
+
+
+def _f1_scores_numpy(Sp, Gp, g_sum):
+    """ Compute the f-score of the predicted summary against each one of the user summaries, using NumPy.
+
+    :param ndarray Sp: The bit-packed predicted summary, as a uint8 array with shape [n_bytes] or longer.
+    :param ndarray Gp: The bit-packed user summaries, as a uint8 array with shape [n_users, n_bytes].
+    :param ndarray g_sum: The number of selected frames of each user summary, with shape [n_users].
+    :return: Array with shape [n_users] containing the f-score for each user.
+    """
+    overlapped = _popcount(Sp[None, :Gp.shape[1]] & Gp, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = overlapped / _popcount(Sp)
+        recall = overlapped / g_sum
+        return np.where(precision + recall == 0, 0.0, 2 * precision * recall * 100 / (precision + recall))
+
+
+if numba is not None:
+    @numba.njit(cache=True, error_model='numpy')
+    def _f1_scores_numba(Sp, Gp, g_sum, n_users, n_bytes, lut):
+        """ Compute the f-score of the predicted summary against each one of the user summaries, using Numba.
+
+        :param ndarray Sp: The bit-packed predicted summary, as a contiguous uint8 array with shape [n_bytes] or longer.
+        :param ndarray Gp: The bit-packed user summaries, as a contiguous uint8 array with shape [n_users, n_bytes].
+        :param ndarray g_sum: The number of selected frames of each user summary, with shape [n_users].
+        :param int n_users: The number of user summaries.
+        :param int n_bytes: The length of the bit-packed user summaries.
+        :param ndarray lut: The number of set bits for each possible byte value.
+        :return: Array with shape [n_users] containing the f-score for each user.
+        """
+        s_sum = 0
+        for i in range(Sp.shape[0]):
+            s_sum += lut[Sp[i]]
+
+        f_scores = np.empty(n_users, dtype=np.float64)
+        for user in range(n_users):
+            overlapped = 0
+            for i in range(n_bytes):
+                overlapped += lut[Sp[i] & Gp[user, i]]
+
+            precision = overlapped / s_sum
+            recall = overlapped / g_sum[user]
+            if precision + recall == 0:
+                f_scores[user] = 0.0
+            else:
+                f_scores[user] = 2 * precision * recall * 100 / (precision + recall)
+        return f_scores
+
+
+def prepare_user(user_summary):
+    """ Prepare the user defined summaries for the comparison with any predicted summary of the same video.
+
+    :param ndarray user_summary: The user defined ground truth summaries (or summary).
+    :return: A tuple of:
+        G: The bit-packed user summaries, as a uint8 array with shape [n_users, n_bytes].
+        g_sum: The number of selected frames of each user summary, with shape [n_users].
+    """
+    # Pack the binary summaries into bits; the overlap becomes a bitwise AND followed by a popcount
+    G = np.packbits(user_summary.astype(np.uint8), axis=1)
+    return G, _popcount(G, axis=1)
+
+
+def score(predicted_summary, G, g_sum):
+    """ Compare the predicted summary with the prepared user defined one(s).
+
+    :param ndarray predicted_summary: The generated summary from our model.
+    :param ndarray G: The bit-packed user summaries, as returned by `prepare_user`.
+    :param ndarray g_sum: The number of selected frames of each user summary, as returned by `prepare_user`.
+    :return: Array with shape [n_users] containing the fscore against each user summary.
+    """
+    S = np.zeros(max(len(predicted_summary), G.shape[1] * 8), dtype=np.uint8)
+    S[:len(predicted_summary)] = predicted_summary
+    Sp = np.packbits(S)
+
+    # Compute precision, recall, f-score for all the users at once
+    if numba is not None:
+        return _f1_scores_numba(Sp, G, g_sum, G.shape[0], G.shape[1], _POPCOUNT_LUT)
+    else:
+        return _f1_scores_numpy(Sp, G, g_sum)
+
+
 def evaluate_summary(predicted_summary, user_summary, eval_method):
     """ Compare the predicted summary with the user defined one(s).
 
@@ -20,39 +126,59 @@ def evaluate_summary(predicted_summary, user_summary, eval_method):
     :param str eval_method: The proposed evaluation method; either 'max' (SumMe) or 'avg' (TVSum).
     :return: The reduced fscore based on the eval_method
     """
-    max_len = max(len(predicted_summary), user_summary.shape[1])
-    S = np.zeros(max_len, dtype=int)
-    G = np.zeros(max_len, dtype=int)
-    S[:len(predicted_summary)] = predicted_summary
+    f_scores = score(predicted_summary, *prepare_user(user_summary))
 
-    f_scores = []
-    for user in range(user_summary.shape[0]):
-        G[:user_summary.shape[1]] = user_summary[user]
-        overlapped = S & G
+    reducer = np.max if eval_method == 'max' else np.mean
+    return float(reducer(f_scores))
 
-        # Compute precision, recall, f-score
-        precision = sum(overlapped)/sum(S)
-        recall = sum(overlapped)/sum(G)
-        if precision+recall == 0:
-            f_scores.append(0)
-        else:
-            f_scores.append(2 * precision * recall * 100 / (precision + recall))
 
-    if eval_method == 'max':
-        return max(f_scores)
-    else:
-        return sum(f_scores)/len(f_scores)
+def load_eval_data(dataset_path):
+    """ Load the per video data needed for the evaluation, from a npz copy stored next to the h5 dataset. The copy is
+    created on the first use -or when the h5 file is newer- by reading each video of the dataset once.
+
+    :param str dataset_path: The path of the h5 dataset.
+    :return: Dictionary with the 'change_points', 'n_frames', 'picks' and 'user_summary' of each video index.
+    """
+    names = ('change_points', 'n_frames', 'picks', 'user_summary')
+    cache_path = os.path.splitext(dataset_path)[0] + '_eval_data.npz'
+    if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(dataset_path):
+        arrays = {}
+        with h5py.File(dataset_path, 'r') as hdf:
+            video_indices = [video_name[6:] for video_name in hdf.keys()]
+            for video_index in video_indices:
+                video = hdf['video_' + video_index]
+                for name in names:
+                    arrays[video_index + '/' + name] = video[name][()]
+
+        # Written under a temporary name and then renamed, as other processes may load the file at the same time
+        tmp_path = f'{os.path.splitext(cache_path)[0]}.{os.getpid()}.npz'
+        try:
+            np.savez(tmp_path, video_indices=np.array(video_indices), **arrays)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # e.g. a read-only dataset folder; the data that was just read is used without being stored
+            return {video_index: {name: arrays[video_index + '/' + name] for name in names}
+                    for video_index in video_indices}
+
+    with np.load(cache_path) as ds:
+        return {video_index: {name: ds[video_index + '/' + name] for name in names}
+                for video_index in ds['video_indices'].tolist()}
+
 
 class Solver(object):
     def __init__(self, config=None, train_loader=None, test_loader=None, train_infer_loader=None):
         """Class that Builds, Trains and Evaluates PGL-SUM model"""
         # Initialize variables to None, to be safe
         self.model, self.optimizer, self.writer = None, None, None
+        self._host_scores = None
+        self._reducer = np.max  # the reduction of the f-scores of the users, for the 'max' eval method of SumMe
 
         self.config = config
         self.train_loader = train_loader
         self.test_loader = test_loader
         self.train_infer_loader = train_infer_loader 
+        # In distributed training, only the first process evaluates, logs and saves the model
+        self.is_main = not self.config.distributed or torch.distributed.get_rank() == 0
 
         # Set the seed for generating reproducible random numbers
         if self.config.seed is not None:
@@ -61,8 +187,26 @@ class Solver(object):
             np.random.seed(self.config.seed)
             random.seed(self.config.seed)
 
+        # Read the data needed for evaluation once, instead of accessing the h5 file for every video on every epoch
+        dataset_path = '../PGL-SUM/data/datasets/' + 'SumMe' + '/eccv16_dataset_' + 'summe' + '_google_pool5.h5'
+        self._hdf_cache, self._eval_cache = {}, {}
+        for video_index, video in load_eval_data(dataset_path).items():
+            self._hdf_cache[video_index] = {'change_points': video['change_points'],
+                                            'n_frames': int(video['n_frames']),
+                                            'picks': video['picks']}
+            # The user summaries never change, so they are prepared once for all the f-score computations
+            G, g_sum = prepare_user(video['user_summary'])
+            self._eval_cache[video_index] = {'G': G, 'g_sum': g_sum}
+
     def build(self):
         """ Function for constructing the PGL-SUM model of its key modules and parameters."""
+        # Let cuDNN pick the fastest algorithms and allow TF32 for the float32 matrix multiplications
+        torch.backends.cudnn.benchmark = True
+        if hasattr(torch, 'set_float32_matmul_precision'):  # PyTorch >= 1.12
+            torch.set_float32_matmul_precision('high')
+        else:
+            torch.backends.cuda.matmul.allow_tf32 = True
+
         # Model creation
         self.model = PGL_SUM(input_size=self.config.input_size,
                              output_size=self.config.input_size,
@@ -73,10 +217,44 @@ class Solver(object):
         if self.config.init_type is not None:
             self.init_weights(self.model, init_type=self.config.init_type, init_gain=self.config.init_gain)
 
+        # Compiled model -sharing its parameters- used for evaluation, avoiding the Python module overhead
+        if self.config.compile:
+            # Graph-level fusion of the model's operations; the number of frames -so the shapes- vary per video
+            self._eval_model = torch.compile(self.model, mode='max-autotune', dynamic=True)
+        else:
+            self._eval_model = torch.jit.script(self.model).eval()
+
+        # Warm-up call, so that the (optional) JIT compilation of the f-score computation is paid once
+        evaluate_summary(np.ones(1), np.ones((1, 1)), 'max')
+
         if self.config.mode == 'train':
+            # The model used for training, synchronizing its gradients across the processes in distributed training
+            if self.config.distributed:
+                device_ids = [self.config.device.index] if self.config.device.type == 'cuda' else None
+                self._train_model = DDP(self.model, device_ids=device_ids,
+                                        find_unused_parameters=self.config.fusion is None)
+            else:
+                self._train_model = self.model
+            if self.config.compile:
+                self._train_model = torch.compile(self._train_model, mode='reduce-overhead', dynamic=True)
+
             # Optimizer initialization
             self.optimizer = optim.Adam(self.model.parameters(), lr=self.config.lr, weight_decay=self.config.l2_req)
-            self.writer = TensorboardWriter(str(self.config.log_dir))
+            if self.is_main:
+                self.writer = TensorboardWriter(str(self.config.log_dir))
+            # The f-scores of the training videos are only logged, so they are computed off the training loop. The
+            # workers are started by a forkserver, as forking the multi-threaded training process may deadlock
+            self._f1_pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('forkserver'))
+            # Mixed precision training on GPU; bfloat16 -when supported- does not need the loss scaling of float16
+            self._amp = self.config.amp and self.config.device.type == 'cuda'
+            self._amp_dtype = torch.bfloat16 if self._amp and torch.cuda.is_bf16_supported() else torch.float16
+            self.scaler = None
+            if self._amp and self._amp_dtype == torch.float16:
+                # torch.amp.GradScaler replaces the deprecated torch.cuda.amp.GradScaler in PyTorch >= 2.3
+                if hasattr(torch, 'amp') and hasattr(torch.amp, 'GradScaler'):
+                    self.scaler = torch.amp.GradScaler('cuda')
+                else:
+                    self.scaler = torch.cuda.amp.GradScaler()
 
     @staticmethod
     def init_weights(net, init_type="xavier", init_gain=1.4142):
@@ -86,68 +264,125 @@ class Solver(object):
         :param str init_type: Name of initialization method: normal | xavier | kaiming | orthogonal.
         :param float init_gain: Scaling factor for normal.
         """
-        for name, param in net.named_parameters():
-            if 'weight' in name and "norm" not in name:
-                if init_type == "normal":
-                    nn.init.normal_(param, mean=0.0, std=init_gain)
-                elif init_type == "xavier":
-                    nn.init.xavier_uniform_(param, gain=np.sqrt(2.0))  # ReLU activation function
-                elif init_type == "kaiming":
-                    nn.init.kaiming_uniform_(param, mode="fan_in", nonlinearity="relu")
-                elif init_type == "orthogonal":
+        weights = [param for name, param in net.named_parameters() if 'weight' in name and "norm" not in name]
+        biases = [param for name, param in net.named_parameters() if 'weight' not in name and 'bias' in name]
+
+        with torch.no_grad():
+            if init_type == "orthogonal":
+                for param in weights:
                     nn.init.orthogonal_(param, gain=np.sqrt(2.0))      # ReLU activation function
+            elif init_type in ("normal", "xavier", "kaiming"):
+                # Draw the values of all the weights at once, then scale them with the std (bound) of each tensor
+                values = torch.empty(sum(param.numel() for param in weights), device=weights[0].device)
+                if init_type == "normal":
+                    values.normal_(mean=0.0, std=1.0)
+                    scales = [init_gain] * len(weights)
                 else:
-                    raise NotImplementedError(f"initialization method {init_type} is not implemented.")
-            elif 'bias' in name:
-                nn.init.constant_(param, 0.1)
+                    values.uniform_(-1.0, 1.0)
+                    scales = []
+                    for param in weights:
+                        fan_in, fan_out = nn.init._calculate_fan_in_and_fan_out(param)
+                        if init_type == "xavier":
+                            scales.append(np.sqrt(2.0) * np.sqrt(6.0 / (fan_in + fan_out)))  # ReLU activation function
+                        else:
+                            scales.append(np.sqrt(2.0) * np.sqrt(3.0 / fan_in))  # fan_in mode, ReLU activation
+                values = [value.view_as(param) for value, param in
+                          zip(torch.split(values, [param.numel() for param in weights]), weights)]
+                torch._foreach_mul_(values, scales)
+                if hasattr(torch, '_foreach_copy_'):  # PyTorch >= 2.1
+                    torch._foreach_copy_(weights, values)
+                else:
+                    for weight, value in zip(weights, values):
+                        weight.copy_(value)
+            else:
+                raise NotImplementedError(f"initialization method {init_type} is not implemented.")
+
+            torch._foreach_zero_(biases)
+            torch._foreach_add_(biases, 0.1)
 
-    criterion = nn.MSELoss()
+    criterion = nn.MSELoss(reduction='none')
 
     def train(self):
+        # The last incomplete batch is dropped, so each process needs at least 'batch_size' of the training videos
+        if len(self.train_loader) == 0:
+            world_size = torch.distributed.get_world_size() if self.config.distributed else 1
+            raise ValueError(f"No training batches: batch_size ({self.config.batch_size}) x world_size ({world_size}) "
+                             f"exceeds the {len(self.train_loader.dataset)} training videos, leaving "
+                             f"{len(self.train_loader.sampler)} videos to each process")
+
         last_loss = 100000
         tol = 7
-        logfile = open('trainlog.txt', 'w')
+        logfile = open('trainlog.txt', 'w') if self.is_main else None
+        # The losses and f-scores of all the videos of an epoch
+        self._loss_buf = torch.zeros(len(self.train_loader) * self.config.batch_size, device=self.config.device)
+        self._f1_buf = np.empty(len(self.train_loader) * self.config.batch_size, dtype=np.float32)
 
         """ Main function to train the PGL-SUM model. """
         for epoch_i in trange(self.config.n_epochs, desc='Epoch', ncols=80):
             self.model.train()
-            f1_score = []
-            loss_history = []
+            if self.config.distributed:
+                self.train_loader.sampler.set_epoch(epoch_i)  # a different shuffling of the videos on each epoch
+            n_losses, n_f1s = 0, 0
 
-            num_batches = int(len(self.train_loader) / self.config.batch_size)  # full-batch or mini batch
+            num_batches = len(self.train_loader)  # full-batch or mini batch
             iterator = iter(self.train_loader)
             for _ in trange(num_batches, desc='Batch', ncols=80, leave=False):
                 # ---- Training ... ----#
                 if self.config.verbose:
                     tqdm.write('Time to train the model...')
 
-                self.optimizer.zero_grad()
-                for _ in trange(self.config.batch_size, desc='Video', ncols=80, leave=False):
-                    frame_features, target, _= next(iterator)
-                    user_summary = target.numpy()
+                self.optimizer.zero_grad(set_to_none=True)  # the gradients are released instead of being zeroed
+                # All the 'batch_size' videos of the batch, padded to the longest one
+                frame_features, target, lengths = next(iterator)
+                user_summary, video_lengths = target.numpy(), lengths.tolist()
 
-                    frame_features = frame_features.to(self.config.device)
-                    target = target.to(self.config.device)
+                frame_features = frame_features.to(self.config.device, non_blocking=True)
+                target = target.to(self.config.device, non_blocking=True)
+                lengths = lengths.to(self.config.device, non_blocking=True)
+                mask = torch.arange(frame_features.shape[1], device=self.config.device)[None, :] < lengths[:, None]
 
-                    output, weights = self.model(frame_features.squeeze(0))
-                    model_summary = output.cpu().detach().numpy().reshape((-1))
-                    loss = self.criterion(output.squeeze(0), target.squeeze(0))
+                with torch.autocast(device_type=self.config.device.type, dtype=self._amp_dtype, enabled=self._amp):
+                    output, weights = self._train_model(frame_features, video_lengths)
+                    output = output.float()
+                    # Mean squared error of each video, over its own -not padded- frames
+                    loss = (self.criterion(output, target) * mask).sum(dim=1) / lengths
+                # Valid until the next batch; the f-score futures of this batch are collected before that
+                model_summary = self.to_host(output).reshape(output.shape)
 
-                    f1 = evaluate_summary(model_summary, user_summary, 'max')
-                    if not np.isnan(f1):
-                        f1_score.append(f1)
+                f1_futures = [self._f1_pool.submit(evaluate_summary, model_summary[video, :length],
+                                                   user_summary[video:video+1, :length], 'max')
+                              for video, length in enumerate(video_lengths)]
 
-                    if self.config.verbose:
-                        tqdm.write(f'[{epoch_i}] loss: {loss.item()}')
+                if self.config.verbose:
+                    tqdm.write(f'[{epoch_i}] loss: {loss.mean().item()}')
 
-                    loss.backward()
-                    loss_history.append(loss.data)
-                # Update model parameters every 'batch_size' iterations
+                # The gradients of the 'batch_size' videos are accumulated, as their losses are summed
+                if self.scaler is not None:
+                    self.scaler.scale(loss.sum()).backward()
+                else:
+                    loss.sum().backward()
+                self._loss_buf[n_losses:n_losses + len(loss)] = loss.detach()
+                n_losses += len(loss)
+                # Update model parameters once for every batch of 'batch_size' videos
+                if self.scaler is not None:
+                    self.scaler.unscale_(self.optimizer)
                 torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.config.clip)
-                self.optimizer.step()
+                if self.scaler is not None:
+                    self.scaler.step(self.optimizer)
+                    self.scaler.update()
+                else:
+                    self.optimizer.step()
+
+                for f1_future in f1_futures:
+                    self._f1_buf[n_f1s] = f1_future.result()
+                    n_f1s += 1
 
             # Mean loss of each training step
-            loss = torch.stack(loss_history).mean()
+            loss = self._loss_buf[:n_losses].mean()
+            if self.config.distributed:
+                # Average over all the processes, so that they all take the same early stopping decision
+                torch.distributed.all_reduce(loss)
+                loss /= torch.distributed.get_world_size()
 
             # Early stopping
             current_loss = loss.cpu().detach().numpy()
@@ -156,8 +391,15 @@ class Solver(object):
             if diff >= tol:
                 break
 
+            if not self.is_main:
+                continue
+
             # Plot
             if self.config.verbose:
+                # The continuous training scores are mostly cast to empty binary summaries, whose f-score is undefined
+                f1_batches = self._f1_buf[:n_f1s]
+                if not np.isnan(f1_batches).all():
+                    tqdm.write(f'[{epoch_i}] f1: {np.nanmean(f1_batches)}')
                 tqdm.write('Plotting...')
 
             self.writer.update_loss(loss, epoch_i, 'loss_epoch')
@@ -180,11 +422,28 @@ class Solver(object):
             print('epoch:' + str(epoch_i) + ' loss:' + str(current_loss) + ' diff:' + str(diff) \
                     + ' f1_train:' + str(f1_train) + ' f1_test:' + str(f1_test) ) 
 
-    def set_summary_from_video_index(self, hdf, video_index, scores):
-        sb = np.array(hdf.get('video_' + video_index + '/change_points'))
-        n_frames = np.array(hdf.get('video_' + video_index + '/n_frames'))
-        positions = np.array(hdf.get('video_' + video_index + '/picks'))
-        summary = generate_summary(sb, scores, n_frames, positions)
+        self._f1_pool.shutdown()
+
+    def to_host(self, scores):
+        """ Copy the (flattened) frames importance scores to the host, through a reusable pinned memory buffer.
+
+        :param torch.Tensor scores: The frames importance scores computed by the model.
+        :return: Array with the flattened scores; a view of the buffer, valid until the next call on GPU.
+        """
+        scores = scores.detach().view(-1)
+        if scores.device.type != 'cuda':
+            return scores.numpy()
+
+        n = scores.shape[0]
+        if self._host_scores is None or self._host_scores.shape[0] < n:
+            self._host_scores = torch.empty(n, dtype=scores.dtype, pin_memory=True)
+        self._host_scores[:n].copy_(scores, non_blocking=True)
+        torch.cuda.current_stream(scores.device).synchronize()
+        return self._host_scores[:n].numpy()
+
+    def set_summary_from_video_index(self, video_index, scores):
+        video = self._hdf_cache[video_index]
+        summary = generate_summary(video['change_points'], scores, video['n_frames'], video['picks'])
         return summary
 
     def evaluate(self, epoch_i, save_weights=False):
@@ -200,28 +459,22 @@ class Solver(object):
         f1_test = []
         f1_train = []
 
-        dataset_path = '../PGL-SUM/data/datasets/' + 'SumMe' + '/eccv16_dataset_' + 'summe' + '_google_pool5.h5'
-
-        hdf = h5py.File(dataset_path, 'r')
-
-
         # For test
         for frame_features, gt_scores, video_name in tqdm(self.test_loader, desc='Evaluate_test', ncols=80, leave=False):
             # [seq_len, input_size]
-            frame_features = frame_features.view(-1, self.config.input_size).to(self.config.device)
+            frame_features = frame_features.view(-1, self.config.input_size).to(self.config.device, non_blocking=True)
 
-            with torch.no_grad():
-                scores, attn_weights = self.model(frame_features)  # [1, seq_len]
-                scores = scores.squeeze(0).cpu().numpy().tolist()
-                attn_weights = attn_weights.cpu().numpy()
+            with torch.inference_mode():
+                scores, attn_weights = self._eval_model(frame_features)  # [1, seq_len]
+                scores = self.to_host(scores)
 
-                out_scores_test[video_name] = scores
+                out_scores_test[video_name] = scores.copy()
 
             # Compute F1 score for test
             video_index = video_name[6:]
-            user_summary = np.array(hdf.get('video_' + video_index + '/user_summary'))
-            summary = self.set_summary_from_video_index(hdf, video_index, scores)
-            f1_score = evaluate_summary(summary, user_summary, 'max')
+            user_summary = self._eval_cache[video_index]
+            summary = self.set_summary_from_video_index(video_index, scores)
+            f1_score = float(self._reducer(score(summary, user_summary['G'], user_summary['g_sum'])))
             f1_test.append(f1_score)
 
         avg_f1_test = np.mean(f1_test)
@@ -229,19 +482,18 @@ class Solver(object):
         # For train
         for frame_features, gt_scores, video_name in tqdm(self.train_infer_loader, desc='Evaluate_train', ncols=80, leave=False):
             # [seq_len, input_size]
-            frame_features = frame_features.view(-1, self.config.input_size).to(self.config.device)
+            frame_features = frame_features.view(-1, self.config.input_size).to(self.config.device, non_blocking=True)
 
-            with torch.no_grad():
-                scores, attn_weights = self.model(frame_features)  # [1, seq_len]
-                scores = scores.squeeze(0).cpu().numpy().tolist()
-                attn_weights = attn_weights.cpu().numpy()
+            with torch.inference_mode():
+                scores, attn_weights = self._eval_model(frame_features)  # [1, seq_len]
+                scores = self.to_host(scores)
 
             # Compute F1 score for test
             video_index = video_name[6:]
-            user_summary = np.array(hdf.get('video_' + video_index + '/user_summary'))
-            summary = self.set_summary_from_video_index(hdf, video_index, scores)
+            user_summary = self._eval_cache[video_index]
+            summary = self.set_summary_from_video_index(video_index, scores)
 
-            f1_score = evaluate_summary(summary, user_summary, 'max')
+            f1_score = float(self._reducer(score(summary, user_summary['G'], user_summary['g_sum'])))
             f1_train.append(f1_score)
     
         avg_f1_train = np.mean(f1_train)